@@ -3,96 +3,592 @@
 # inventory, using a Neon Postgres database for persistence.
 #
 # Performance notes:
-# - The database connection is cached at module level and reused across warm
-#   invocations. Opening a TLS connection to Neon is the single most expensive
+# - Database connections come from a module-level pool and are reused across
+#   warm invocations. Opening a TLS connection to Neon is the single most expensive
 #   step of a request, so paying it only on cold starts (or after the
 #   connection drops) matters far more than any query tuning here.
-# - Table creation is deferred to the first request instead of import time,
-#   so a briefly unreachable database can no longer fail the whole import
-#   (FUNCTION_INVOCATION_FAILED) and cold starts skip one extra roundtrip.
-
+# - DB_TRANSPORT=http swaps the Postgres connection for Neon's HTTP SQL
+#   endpoint, trading session features for a handshake-free cold start.
+# - Table creation is a separate migration step (migrate_schema()), not import
+#   time or the request path, so a briefly unreachable database can't fail the
+#   whole import (FUNCTION_INVOCATION_FAILED) and cold starts skip a roundtrip.
+# - The inventory JSON is built by Postgres (json_agg) and passed through as
+#   bytes. Other responses are small and go through orjson when it's
+#   installed, which returns bytes directly and skips the str -> bytes encode.
+# - gzip (and the optional brotli) are only needed for compressed responses,
+#   so they're imported where they're used, keeping them out of the import
+#   graph every cold start evaluates.
+
+import hashlib
 import hmac
-import json
+import http.client
+import importlib.util
 import logging
 import os
-from datetime import datetime, timezone
+import re
+import threading
+import time
 
 import psycopg2
-import psycopg2.extras
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
 from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlparse, unquote
+from urllib.parse import urlparse, unquote, urlsplit
+
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:  # fall back to the stdlib if orjson is unavailable
+    import json
+
+    def _dumps(data):
+        return json.dumps(data).encode("utf-8")
+
+    _loads = json.loads
+
+# br is only offered when the optional brotli package is installed. Probe for
+# it without importing; like gzip, it's imported only when a response uses it.
+HAVE_BROTLI = importlib.util.find_spec("brotli") is not None
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 API_KEY = os.environ.get("API_KEY")
-
-# Connection cached for the lifetime of the (warm) function instance.
-_conn = None
-_table_ready = False
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+# "http" sends each statement to Neon's HTTP SQL endpoint instead of opening a
+# Postgres connection; see NeonHttpConnection below.
+DB_TRANSPORT = (os.environ.get("DB_TRANSPORT") or "psycopg2").lower()
+NEON_HTTP_HOST = os.environ.get("NEON_HTTP_HOST")
+
+# Connection pool kept for the lifetime of the (warm) function instance. It is
+# built lazily on the first request, never at import time. One idle connection
+# is kept warm; extra connections opened under concurrent load are closed when
+# returned. Keep the maximum small: Neon's -pooler endpoint already handles
+# fan-out on the server side.
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX") or 4)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# GET /api/inventory has Postgres build the whole JSON array, so the response
+# body arrives as one string: no per-row Python objects or serialization.
+LIST_SERVERS_SQL = """
+    SELECT coalesce(json_agg(json_build_object(
+        'name', name,
+        'ip', ip,
+        'location', location,
+        'status', status,
+        'last_report', to_char(last_report, 'YYYY-MM-DD"T"HH24:MI:SS.US')
+    )), '[]')::text
+    FROM servers
+"""
+
+# Hot statements are PREPAREd once per connection so warm requests skip the
+# parse and plan steps. SQL-level PREPARE does not survive PgBouncer's
+# transaction pooling, so this is off for Neon's -pooler hosts and the HTTP
+# transport. DB_PREPARED_STATEMENTS=0/1 overrides the detection.
+def _prepared_statements_enabled():
+    setting = (os.environ.get("DB_PREPARED_STATEMENTS") or "auto").lower()
+    if setting != "auto":
+        return setting in ("1", "true", "yes", "on")
+    host = urlsplit(DATABASE_URL or "").hostname or ""
+    return DB_TRANSPORT != "http" and "-pooler" not in host
+
+
+USE_PREPARED_STATEMENTS = _prepared_statements_enabled()
+
+_PREPARE_SQL = """
+    PREPARE report_upsert (varchar, varchar, varchar, varchar) AS
+        INSERT INTO servers (name, ip, location, status, last_report)
+        VALUES ($1, $2, $3, $4, NOW())
+        ON CONFLICT (name) DO UPDATE SET
+            ip = EXCLUDED.ip,
+            location = EXCLUDED.location,
+            status = EXCLUDED.status,
+            last_report = EXCLUDED.last_report
+        RETURNING name, (xmax = 0) AS inserted;
+    PREPARE delete_server (varchar) AS
+        DELETE FROM servers WHERE name = $1 RETURNING 1;
+    PREPARE list_servers AS
+        {list_servers};
+""".format(list_servers=LIST_SERVERS_SQL)
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers whether _PREPARE_SQL ran on it."""
+
+    statements_prepared = False
+
+
+def _prepare_statements(conn):
+    """PREPAREs the hot statements on conn the first time it is used."""
+    if conn.statements_prepared or not USE_PREPARED_STATEMENTS:
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute(_PREPARE_SQL)
+    except psycopg2.errors.UndefinedTable:
+        # Not migrated yet; let the request itself (or the migration) run.
+        logging.warning("servers table is missing; run POST /api/admin/migrate.")
+        conn.rollback()
+        return
+    conn.commit()
+    conn.statements_prepared = True
 
 
-def get_db_connection():
-    """Returns the cached connection, reconnecting only if it's gone stale."""
-    global _conn
+def _get_pool():
+    """Returns the connection pool, creating it on first use."""
+    global _pool
+    if _pool is not None:
+        return _pool
     if not DATABASE_URL:
         logging.error("DATABASE_URL environment variable is not set.")
         raise ValueError("DATABASE_URL environment variable is not set.")
 
-    if _conn is not None and _conn.closed == 0:
-        return _conn
+    with _pool_lock:
+        if _pool is None:
+            _pool = psycopg2.pool.ThreadedConnectionPool(
+                1,
+                DB_POOL_MAX,
+                DATABASE_URL,
+                connect_timeout=5,
+                keepalives=1,
+                keepalives_idle=30,
+                keepalives_interval=10,
+                keepalives_count=3,
+                connection_factory=PooledConnection,
+            )
+            logging.info("Opened database connection pool.")
+    return _pool
+
 
+def get_db_connection():
+    """Checks a connection out of the pool, replacing it if it's gone stale."""
+    if DB_TRANSPORT == "http":
+        return _get_http_connection()
     try:
-        _conn = psycopg2.connect(
-            DATABASE_URL,
-            connect_timeout=5,
-            keepalives=1,
-            keepalives_idle=30,
-            keepalives_interval=10,
-            keepalives_count=3,
-        )
-        logging.info("Opened new database connection.")
-        return _conn
+        pool = _get_pool()
+        conn = pool.getconn()
+        if conn.closed:
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        return conn
     except psycopg2.OperationalError as e:
         logging.error(f"Operational error while connecting to PostgreSQL: {e}")
         raise
-    except Exception as e:
-        logging.error(f"An unexpected error occurred during database connection: {e}")
+    except psycopg2.pool.PoolError as e:
+        logging.error(f"Database connection pool exhausted: {e}")
         raise
 
 
-def _reset_connection():
-    """Drops the cached connection so the next request reconnects cleanly."""
-    global _conn
-    if _conn is not None:
+def release_connection(conn):
+    """Returns a connection to the pool, discarding it if it has been closed."""
+    if isinstance(conn, NeonHttpConnection):
+        return
+    _pool.putconn(conn, close=bool(conn.closed))
+
+
+def run_db(work, transaction=False):
+    """
+    Runs work(conn) on a pooled connection. By default the connection is in
+    autocommit mode, which suits the single-statement handlers: psycopg2 then
+    sends neither BEGIN nor COMMIT, saving two roundtrips per request. Pass
+    transaction=True when work issues several statements that must apply
+    together; it is then committed as one transaction. If the connection
+    turns out to have been dropped (e.g. Neon suspended the compute while we
+    were idle), reconnects and retries once. Any other database error rolls
+    the transaction back so the connection can go back into the pool.
+    """
+    shared = getattr(_transaction, "conn", None)
+    if shared is not None:
         try:
-            _conn.close()
+            return work(shared)
+        except Exception as error:
+            if _transaction.error is None:
+                _transaction.error = error
+            raise
+
+    for attempt in range(2):
+        conn = get_db_connection()
+        try:
+            if isinstance(conn, PooledConnection):
+                conn.autocommit = not transaction
+                _prepare_statements(conn)
+            result = work(conn)
+            conn.commit()
+            return result
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            if conn.closed == 0:
+                _rollback(conn)
+                raise
+            if attempt:
+                raise
+            logging.warning("Pooled database connection was closed; reconnecting.")
         except Exception:
-            pass
-    _conn = None
+            _rollback(conn)
+            raise
+        finally:
+            release_connection(conn)
 
 
-def ensure_servers_table():
-    """Creates the 'servers' table once per function instance."""
-    global _table_ready
-    if _table_ready:
-        return
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS servers (
-                name VARCHAR(255) PRIMARY KEY,
-                ip VARCHAR(45) NOT NULL,
-                location VARCHAR(255),
-                status VARCHAR(50),
-                last_report TIMESTAMP
-            );
-        """)
-    conn.commit()
-    _table_ready = True
+_transaction = threading.local()
+
+
+def run_in_one_transaction(work):
+    """
+    Runs work() so that every run_db() call it makes shares one connection
+    and one commit. Handlers catch their own errors, so a failure inside is
+    recorded and re-raised here; nothing commits if any run_db() call failed.
+    On DB_TRANSPORT=http statements still autocommit individually, which is
+    why _handle_batch only accepts read-only batches there.
+    """
+    def run(conn):
+        _transaction.conn = conn
+        _transaction.error = None
+        try:
+            result = work()
+        finally:
+            error = _transaction.error
+            _transaction.conn = _transaction.error = None
+        if error is not None:
+            raise error
+        return result
+
+    return run_db(run, transaction=True)
+
+
+def _rollback(conn):
+    """Rolls back a failed transaction, closing the connection if that fails too."""
+    try:
+        conn.rollback()
+    except Exception:
+        conn.close()
+
+
+# --- Neon HTTP transport ---
+# For cold-start-heavy deployments, DB_TRANSPORT=http skips the Postgres
+# TCP + TLS + startup + auth handshake entirely: every statement is one HTTPS
+# POST to Neon's /sql endpoint. One HTTPS connection is held at module scope
+# (like _pool) and kept alive across warm invocations, so only the first
+# request of an instance pays the TLS handshake. Statements autocommit
+# individually, so commit()/rollback() are no-ops on this transport.
+
+class NeonHttpError(Exception):
+    """A statement was rejected by Neon's HTTP SQL endpoint."""
+
+
+_PLACEHOLDER = re.compile(r"%(s|%)")
+_http_conn = None
+_http_conn_lock = threading.Lock()
+
+
+def _neon_http_host():
+    if NEON_HTTP_HOST:
+        return NEON_HTTP_HOST
+    # ep-foo-123.us-east-2.aws.neon.tech -> api.us-east-2.aws.neon.tech
+    host = urlsplit(DATABASE_URL).hostname or ""
+    return re.sub(r"^[^.]+\.", "api.", host, count=1)
+
+
+def _get_http_connection():
+    if not DATABASE_URL:
+        logging.error("DATABASE_URL environment variable is not set.")
+        raise ValueError("DATABASE_URL environment variable is not set.")
+    global _http_conn
+    if _http_conn is None:
+        with _http_conn_lock:
+            if _http_conn is None:
+                _http_conn = NeonHttpConnection(_neon_http_host())
+    return _http_conn
+
+
+def _to_param(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+# Raw text values by type OID; anything not listed stays a string.
+_TEXT_PARSERS = {
+    16: lambda v: v == "t",  # bool
+    20: int,  # int8
+    21: int,  # int2
+    23: int,  # int4
+}
+
+
+class NeonHttpConnection:
+    """The subset of the psycopg2 connection API used by run_db() handlers."""
+
+    closed = 0
+
+    def __init__(self, host):
+        self.host = host
+        self._https = None
+        # http.client connections are not thread-safe; one request at a time.
+        self._lock = threading.Lock()
+
+    def cursor(self):
+        return NeonHttpCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def _drop(self):
+        """Closes the kept-alive HTTPS connection; the next query reopens it."""
+        self._https.close()
+        self._https = None
+
+    def query(self, sql, params):
+        with self._lock:
+            return self._query(sql, params)
+
+    def _query(self, sql, params):
+        body = _dumps({"query": sql, "params": [_to_param(p) for p in params]})
+        headers = {
+            "Content-Type": "application/json",
+            "Neon-Connection-String": DATABASE_URL,
+            "Neon-Raw-Text-Output": "true",
+            "Neon-Array-Mode": "true",
+        }
+        # Retry only when a kept-alive socket turns out to have been closed
+        # before Neon saw the statement: a reset while sending it, or a close
+        # with no response at all. Any later failure (notably a read timeout)
+        # may mean the statement already ran, so retrying could run it twice.
+        for attempt in range(2):
+            reused = self._https is not None
+            if not reused:
+                self._https = http.client.HTTPSConnection(self.host, timeout=10)
+            try:
+                try:
+                    self._https.request("POST", "/sql", body=body, headers=headers)
+                except (ConnectionResetError, BrokenPipeError):
+                    if reused and not attempt:
+                        self._drop()
+                        continue
+                    raise
+                try:
+                    response = self._https.getresponse()
+                except http.client.RemoteDisconnected:
+                    if reused and not attempt:
+                        self._drop()
+                        continue
+                    raise
+                payload = _loads(response.read())
+                break
+            except Exception:
+                self._drop()
+                raise
+        if response.status != 200:
+            raise NeonHttpError(payload.get("message") or f"HTTP {response.status}")
+        return payload
+
+
+class NeonHttpCursor:
+    """DB-API-style cursor that runs each execute() as one HTTP request."""
+
+    def __init__(self, conn):
+        self.connection = conn
+        self.rowcount = -1
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        # psycopg2-style %s placeholders -> Postgres $n placeholders.
+        counter = iter(range(1, len(params) + 1))
+        sql = _PLACEHOLDER.sub(lambda m: f"${next(counter)}" if m.group(1) == "s" else "%", sql)
+        result = self.connection.query(sql, params)
+        parsers = [_TEXT_PARSERS.get(f.get("dataTypeID")) for f in result.get("fields") or []]
+        self._rows = [
+            tuple(v if v is None or parse is None else parse(v) for v, parse in zip(raw, parsers))
+            for raw in result.get("rows") or []
+        ]
+        self.rowcount = result.get("rowCount", -1)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+
+def migrate_schema():
+    """
+    Creates the 'servers' table and its indexes if they are missing. This runs from
+    POST /api/admin/migrate or `python api/index.py migrate`, never on the
+    request path, so cold starts don't pay an extra roundtrip for it.
+    """
+    def create(conn):
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS servers (
+                    name VARCHAR(255) PRIMARY KEY,
+                    ip VARCHAR(45) NOT NULL,
+                    location VARCHAR(255),
+                    status VARCHAR(50),
+                    last_report TIMESTAMP
+                );
+            """)
+            # One command per execute(): Neon's HTTP endpoint rejects
+            # multi-command strings.
+            cur.execute("CREATE INDEX IF NOT EXISTS servers_last_report_idx ON servers (last_report);")
+
+    run_db(create)
     logging.info("Servers table ensured to exist.")
 
 
+# Bodies smaller than this aren't worth compressing: gzip's ~20 byte overhead
+# can make them larger.
+COMPRESS_MIN_BYTES = 1024
+
+# Serialized GET /api/inventory body, reused for INVENTORY_CACHE_TTL seconds
+# so warm hits skip both the query and serialization. The cache is per
+# function instance: writes handled here invalidate it immediately, writes
+# handled by other instances show up once the TTL lapses.
+INVENTORY_CACHE_TTL = float(os.environ.get("INVENTORY_CACHE_TTL") or 5.0)
+
+# Lets clients reuse an inventory response for as long as this instance would
+# serve it from cache, then revalidate with If-None-Match. "private" because
+# the response requires Authorization: a shared cache like Vercel's edge must
+# not hand it to other callers.
+INVENTORY_CACHE_CONTROL = f"private, max-age={int(INVENTORY_CACHE_TTL)}, stale-while-revalidate=30"
+
+_inventory_cache = {"entry": None, "expires": 0.0, "generation": 0}
+
+
+class RawJSON:
+    """Bytes that are already serialized JSON, sent as-is (with an ETag if given)."""
+
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body, etag=None):
+        self.body = body
+        self.etag = etag
+
+
+def make_etag(body):
+    """Strong ETag for a response body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _etag_for_encoding(etag, encoding):
+    """Weakens etag for compressed bodies: their bytes differ, so a strong validator would lie."""
+    if encoding and not etag.startswith("W/"):
+        return "W/" + etag
+    return etag
+
+
+def get_cached_inventory():
+    """Returns the cached RawJSON body, or None if it is missing or expired."""
+    if time.monotonic() < _inventory_cache["expires"]:
+        return _inventory_cache["entry"]
+    return None
+
+
+def store_cached_inventory(body, generation):
+    """
+    Returns body as a RawJSON with its ETag, caching it unless a write
+    invalidated the cache since generation was read. Bodies read inside
+    run_in_one_transaction() are never cached: they may include rows the
+    batch has not committed (and might still roll back).
+    """
+    entry = RawJSON(body, make_etag(body))
+    if getattr(_transaction, "conn", None) is not None:
+        return entry
+    if INVENTORY_CACHE_TTL > 0 and generation == _inventory_cache["generation"]:
+        _inventory_cache["entry"] = entry
+        _inventory_cache["expires"] = time.monotonic() + INVENTORY_CACHE_TTL
+    return entry
+
+
+def invalidate_inventory_cache():
+    """Drops the cached inventory; call after any write to the servers table."""
+    _inventory_cache["generation"] += 1
+    _inventory_cache["expires"] = 0.0
+
+
+# Upper bound on servers accepted by one POST /api/report.
+REPORT_BATCH_MAX = 1000
+# Rows per INSERT statement; keeps the parameter count well under limits.
+_UPSERT_PAGE_SIZE = 500
+
+_UPSERT_SQL = """
+    INSERT INTO servers (name, ip, location, status, last_report)
+    VALUES {values}
+    ON CONFLICT (name) DO UPDATE SET
+        ip = EXCLUDED.ip,
+        location = EXCLUDED.location,
+        status = EXCLUDED.status,
+        last_report = EXCLUDED.last_report
+    RETURNING name, (xmax = 0) AS inserted;
+"""
+
+
+def upsert_servers(cur, rows):
+    """
+    Upserts (name, ip, location, status) rows, one multi-row statement per
+    page. last_report is stamped by the database with NOW(). Returns
+    {name: created}, where created is False if the row already existed
+    (xmax is 0 only on freshly inserted tuples).
+    """
+    if len(rows) == 1 and getattr(cur.connection, "statements_prepared", False):
+        cur.execute("EXECUTE report_upsert (%s, %s, %s, %s);", rows[0])
+        return dict(cur.fetchall())
+    created = {}
+    for start in range(0, len(rows), _UPSERT_PAGE_SIZE):
+        page = rows[start:start + _UPSERT_PAGE_SIZE]
+        values = ", ".join(["(%s, %s, %s, %s, NOW())"] * len(page))
+        cur.execute(_UPSERT_SQL.format(values=values), [value for row in page for value in row])
+        created.update(cur.fetchall())
+    return created
+
+
+# Upper bound on sub-requests accepted by one POST /api/batch.
+BATCH_MAX = 20
+
+# (method, path) -> (handler method, what it's called with): "body" for the
+# parsed JSON body, "name" for the server name in the path, None for nothing.
+# DELETE /api/delete/<name> is the only parameterised route; match_route()
+# maps it onto its DELETE_PREFIX key.
+DELETE_PREFIX = "/api/delete/"
+ROUTES = {
+    ("GET", "/api/inventory"): ("_handle_get_inventory", None),
+    ("POST", "/api/report"): ("_handle_report", "body"),
+    ("POST", "/api/batch"): ("_handle_batch", "body"),
+    ("POST", "/api/admin/migrate"): ("_handle_migrate", None),
+    ("DELETE", DELETE_PREFIX): ("_handle_delete_server", "name"),
+}
+# Routes a /api/batch sub-request may target: no nested batches, no admin.
+BATCH_ROUTES = {("GET", "/api/inventory"), ("POST", "/api/report"), ("DELETE", DELETE_PREFIX)}
+
+
+def match_route(method, path):
+    """Returns (ROUTES key, server name or None), or (None, None) if nothing matches."""
+    # Checked first so the prefix key never matches as an exact path (which
+    # would call the handler with no server name).
+    if method == "DELETE" and path.startswith(DELETE_PREFIX):
+        return (method, DELETE_PREFIX), unquote(path[len(DELETE_PREFIX):])
+    key = (method, path)
+    if key in ROUTES:
+        return key, None
+    return None, None
+
+
 class handler(BaseHTTPRequestHandler):
     """
     Vercel expects a class named 'handler' that inherits from
@@ -101,36 +597,114 @@ class handler(BaseHTTPRequestHandler):
     """
 
     def do_GET(self):
-        path = urlparse(self.path).path
-        if path == "/api/inventory":
-            self._handle_get_inventory()
-        else:
-            self._send_404()
+        self._dispatch("GET")
 
     def do_POST(self):
-        path = urlparse(self.path).path
-        if path == "/api/report":
-            self._handle_report()
-        else:
-            self._send_404()
+        self._dispatch("POST")
 
     def do_DELETE(self):
-        path = urlparse(self.path).path
-        if path.startswith("/api/delete/"):
-            server_name = unquote(path.split("/api/delete/", 1)[1])
-            self._handle_delete_server(server_name)
-        else:
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        key, server_name = match_route(method, urlparse(self.path).path)
+        if key is None:
             self._send_404()
+            return
+        body = None
+        if ROUTES[key][1] == "body":
+            try:
+                body = self._read_json_body()
+            except ValueError:
+                self._send_response(400, {"error": "Invalid JSON payload or missing fields."})
+                return
+        self._send_response(*self._call_route(key, server_name, body))
+
+    def _call_route(self, key, server_name, body):
+        name, argument = ROUTES[key]
+        handle = getattr(self, name)
+        if argument == "body":
+            return handle(body)
+        if argument == "name":
+            return handle(server_name)
+        return handle()
 
     # --- Private Handler Methods ---
     def _send_response(self, status_code, data):
-        body = json.dumps(data).encode("utf-8")
+        """
+        Sends data as JSON. Only bodies with an ETag (the inventory) may be
+        reused by the client; everything else, including errors and write
+        results, is marked no-store.
+        """
+        if not isinstance(data, RawJSON):
+            self._send_body(status_code, _dumps(data), {"Cache-Control": "no-store"})
+        elif data.etag is None:
+            self._send_body(status_code, data.body, {"Cache-Control": "no-store"})
+        elif self._etag_matches(data.etag):
+            # Same validator and Vary as the 200 this replaces would carry.
+            encoding = self._encoding_for(data.body)
+            self.send_response(304)
+            self.send_header("ETag", _etag_for_encoding(data.etag, encoding))
+            self.send_header("Cache-Control", INVENTORY_CACHE_CONTROL)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+        else:
+            self._send_body(status_code, data.body, {"ETag": data.etag, "Cache-Control": INVENTORY_CACHE_CONTROL})
+
+    def _send_body(self, status_code, body, headers=None):
+        """Sends an already-serialized JSON body, compressed if the client allows it."""
+        headers = dict(headers or {})
+        encoding = self._encoding_for(body)
+        if encoding == "br":
+            import brotli
+
+            body = brotli.compress(body, quality=4)
+        elif encoding == "gzip":
+            import gzip
+
+            body = gzip.compress(body, compresslevel=1)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            if "ETag" in headers:
+                headers["ETag"] = _etag_for_encoding(headers["ETag"], encoding)
         self.send_response(status_code)
         self.send_header("Content-type", "application/json")
         self.send_header("Content-Length", str(len(body)))
+        self.send_header("Vary", "Accept-Encoding")
+        for name, value in headers.items():
+            self.send_header(name, value)
         self.end_headers()
         self.wfile.write(body)
 
+    def _encoding_for(self, body):
+        """Content-coding to send body with, or None if it stays uncompressed."""
+        return self._choose_encoding() if len(body) >= COMPRESS_MIN_BYTES else None
+
+    def _choose_encoding(self):
+        """Picks br or gzip from Accept-Encoding, or None for an identity body."""
+        accepted = set()
+        for item in (self.headers.get("Accept-Encoding") or "").split(","):
+            coding, _, params = item.partition(";")
+            params = params.replace(" ", "")
+            if params.startswith("q="):
+                try:
+                    if float(params[2:]) == 0:
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(coding.strip().lower())
+        if HAVE_BROTLI and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _etag_matches(self, etag):
+        if_none_match = self.headers.get("If-None-Match")
+        if not if_none_match:
+            return False
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
     def _send_404(self):
         self._send_response(404, {"error": "Endpoint not found."})
 
@@ -140,91 +714,200 @@ class handler(BaseHTTPRequestHandler):
             logging.error("API_KEY environment variable is not set.")
             return False
         auth = self.headers.get('Authorization') or ""
-        return hmac.compare_digest(auth, f'Bearer {API_KEY}')
+        return hmac.compare_digest(auth.encode("utf-8"), f'Bearer {API_KEY}'.encode("utf-8"))
 
-    def _handle_report(self):
-        try:
-            content_length = int(self.headers.get('Content-Length') or 0)
-            if content_length <= 0:
-                self._send_response(400, {"error": "Missing request body."})
-                return
-            server_data = json.loads(self.rfile.read(content_length))
+    def _check_admin_token(self):
+        """Constant-time X-Admin-Token check against ADMIN_TOKEN."""
+        if not ADMIN_TOKEN:
+            logging.error("ADMIN_TOKEN environment variable is not set.")
+            return False
+        token = self.headers.get('X-Admin-Token') or ""
+        # Compare bytes: compare_digest raises TypeError on non-ASCII str.
+        return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
 
-            if "name" not in server_data or "ip" not in server_data:
-                self._send_response(400, {"error": "Missing required fields (name, ip)"})
-                return
+    def _read_json_body(self):
+        """Returns the parsed request body, or None if there is none."""
+        content_length = int(self.headers.get('Content-Length') or 0)
+        if content_length <= 0:
+            return None
+        return _loads(self.rfile.read(content_length))
+
+    # Each _handle_* takes already-parsed input and returns a
+    # (status_code, data) pair; do_* and _handle_batch decide how to send it.
 
-            ensure_servers_table()
-            conn = get_db_connection()
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO servers (name, ip, location, status, last_report)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (name) DO UPDATE SET
-                        ip = EXCLUDED.ip,
-                        location = EXCLUDED.location,
-                        status = EXCLUDED.status,
-                        last_report = EXCLUDED.last_report;
-                """, (
+    def _handle_report(self, payload):
+        try:
+            if payload is None:
+                return 400, {"error": "Missing request body."}
+
+            # A JSON array reports many servers in one request and one statement.
+            is_batch = isinstance(payload, list)
+            reports = payload if is_batch else [payload]
+            if not reports or len(reports) > REPORT_BATCH_MAX:
+                return 400, {"error": f"Batch must contain 1 to {REPORT_BATCH_MAX} servers."}
+            for server_data in reports:
+                if not isinstance(server_data, dict) or "name" not in server_data or "ip" not in server_data:
+                    return 400, {"error": "Missing required fields (name, ip)"}
+                if not isinstance(server_data["name"], str) or not isinstance(server_data["ip"], str):
+                    return 400, {"error": "Fields name and ip must be strings."}
+
+            # Keyed by name so the last entry wins: a single upsert may not
+            # touch the same row twice.
+            rows = {
+                server_data["name"]: (
                     server_data["name"],
                     server_data["ip"],
                     server_data.get("location", "Unknown"),
                     server_data.get("status", "Online"),
-                    datetime.now(timezone.utc),
-                ))
-            conn.commit()
-            logging.info(f"Received and updated data for server: {server_data['name']}")
-            self._send_response(200, {"message": f"Server {server_data['name']} data updated successfully."})
+                )
+                for server_data in reports
+            }
+
+            def upsert(conn):
+                with conn.cursor() as cur:
+                    return upsert_servers(cur, list(rows.values()))
+
+            # Batches over one page take several statements; keep them atomic.
+            created = run_db(upsert, transaction=len(rows) > _UPSERT_PAGE_SIZE)
+            invalidate_inventory_cache()
+            if is_batch:
+                logging.info(f"Received and updated data for {len(rows)} servers.")
+                return 200, [
+                    {
+                        "name": server_data["name"],
+                        "message": f"Server {server_data['name']} data updated successfully.",
+                        "created": created.get(server_data["name"], False),
+                    }
+                    for server_data in reports
+                ]
+            server_name = reports[0]["name"]
+            logging.info(f"Received and updated data for server: {server_name}")
+            return 200, {
+                "message": f"Server {server_name} data updated successfully.",
+                "created": created.get(server_name, False),
+            }
 
-        except (json.JSONDecodeError, ValueError):
-            self._send_response(400, {"error": "Invalid JSON payload or missing fields."})
         except (Exception, psycopg2.Error) as error:
             logging.error(f"Error handling report: {error}")
-            _reset_connection()
-            self._send_response(500, {"error": "Failed to update server data due to a database error."})
+            return 500, {"error": "Failed to update server data due to a database error."}
 
     def _handle_get_inventory(self):
+        """Returns (status_code, data); data is a cached RawJSON body on success."""
         if not self._check_auth():
             logging.warning("Unauthorized access attempt to /api/inventory")
-            self._send_response(401, {"error": "Unauthorized"})
-            return
+            return 401, {"error": "Unauthorized"}
 
-        try:
-            ensure_servers_table()
-            conn = get_db_connection()
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("SELECT name, ip, location, status, last_report FROM servers;")
-                servers_list = cur.fetchall()
-            conn.commit()
-
-            for server in servers_list:
-                if server['last_report'] is not None:
-                    server['last_report'] = server['last_report'].isoformat()
+        cached = get_cached_inventory()
+        if cached is not None:
+            return 200, cached
 
-            self._send_response(200, servers_list)
+        try:
+            def fetch(conn):
+                with conn.cursor() as cur:
+                    if isinstance(conn, PooledConnection):
+                        # Hand back the JSON text as the raw bytes libpq
+                        # received, skipping a decode to str and re-encode.
+                        psycopg2.extensions.register_type(psycopg2.extensions.BYTES, cur)
+                    if getattr(conn, "statements_prepared", False):
+                        cur.execute("EXECUTE list_servers;")
+                    else:
+                        cur.execute(LIST_SERVERS_SQL)
+                    body = cur.fetchone()[0]
+                return body if isinstance(body, bytes) else body.encode("utf-8")
+
+            generation = _inventory_cache["generation"]
+            body = run_db(fetch)
+            return 200, store_cached_inventory(body, generation)
 
         except (Exception, psycopg2.Error) as error:
             logging.error(f"Error getting inventory: {error}")
-            _reset_connection()
-            self._send_response(500, {"error": "Failed to retrieve inventory."})
+            return 500, {"error": "Failed to retrieve inventory."}
 
     def _handle_delete_server(self, server_name):
         try:
-            ensure_servers_table()
-            conn = get_db_connection()
-            with conn.cursor() as cur:
-                cur.execute("DELETE FROM servers WHERE name = %s;", (server_name,))
-                rows_deleted = cur.rowcount
-            conn.commit()
-
-            if rows_deleted > 0:
+            def delete(conn):
+                with conn.cursor() as cur:
+                    if getattr(conn, "statements_prepared", False):
+                        cur.execute("EXECUTE delete_server (%s);", (server_name,))
+                    else:
+                        cur.execute("DELETE FROM servers WHERE name = %s RETURNING 1;", (server_name,))
+                    return cur.fetchone() is not None
+
+            if run_db(delete):
+                invalidate_inventory_cache()
                 logging.info(f"Server {server_name} deleted successfully.")
-                self._send_response(200, {"message": f"Server {server_name} deleted successfully."})
-            else:
-                logging.warning(f"Attempted to delete non-existent server: {server_name}")
-                self._send_response(404, {"error": "Server not found."})
+                return 200, {"message": f"Server {server_name} deleted successfully."}
+            logging.warning(f"Attempted to delete non-existent server: {server_name}")
+            return 404, {"error": "Server not found."}
 
         except (Exception, psycopg2.Error) as error:
             logging.error(f"Error deleting server: {error}")
-            _reset_connection()
-            self._send_response(500, {"error": "Failed to delete server."})
+            return 500, {"error": "Failed to delete server."}
+
+    def _handle_migrate(self):
+        if not self._check_admin_token():
+            logging.warning("Unauthorized access attempt to /api/admin/migrate")
+            return 401, {"error": "Unauthorized"}
+        try:
+            migrate_schema()
+            return 200, {"message": "Schema is up to date."}
+        except (Exception, psycopg2.Error) as error:
+            logging.error(f"Error migrating schema: {error}")
+            return 500, {"error": "Failed to migrate schema."}
+
+    def _handle_batch(self, payload):
+        """
+        Runs up to BATCH_MAX sub-requests ({"id", "method", "url", "body"?})
+        against the handlers above and returns their results in order as
+        {"id", "statusCode", "body"}. Sub-requests share this request's
+        headers (so one Authorization covers all of them) and one database
+        transaction: if any of them hits a database error, nothing is applied
+        and the whole batch fails.
+        """
+        requests = payload.get("requests") if isinstance(payload, dict) else None
+        if not isinstance(requests, list) or not requests or len(requests) > BATCH_MAX:
+            return 400, {"error": f"'requests' must be a list of 1 to {BATCH_MAX} sub-requests."}
+        for sub in requests:
+            if not isinstance(sub, dict) or not isinstance(sub.get("method"), str) or not isinstance(sub.get("url"), str):
+                return 400, {"error": "Each sub-request needs a method and a url."}
+        # The HTTP transport autocommits every statement, so a batch could not
+        # roll back earlier writes when a later sub-request fails.
+        if DB_TRANSPORT == "http" and any(sub["method"].upper() != "GET" for sub in requests):
+            return 400, {"error": "Batches with write sub-requests are not supported on this deployment; send them individually."}
+
+        def run_all():
+            return [
+                (sub.get("id", index), *self._dispatch_subrequest(sub))
+                for index, sub in enumerate(requests)
+            ]
+
+        try:
+            results = run_in_one_transaction(run_all)
+        except (Exception, psycopg2.Error) as error:
+            logging.error(f"Error running batch: {error}")
+            return 500, {"error": "Batch failed; no changes were applied."}
+        # Sub-writes invalidated the cache before the commit; a concurrent
+        # reader may have re-cached the pre-commit rows since.
+        invalidate_inventory_cache()
+
+        parts = []
+        for sub_id, status_code, data in results:
+            # Inventory bodies are already serialized; splice them in as-is.
+            body = data.body if isinstance(data, RawJSON) else _dumps(data)
+            parts.append(b'{"id":' + _dumps(sub_id) + b',"statusCode":' + str(status_code).encode() + b',"body":' + body + b'}')
+        return 200, RawJSON(b"[" + b",".join(parts) + b"]")
+
+    def _dispatch_subrequest(self, sub):
+        key, server_name = match_route(sub["method"].upper(), urlparse(sub["url"]).path)
+        if key not in BATCH_ROUTES:
+            return 404, {"error": "Endpoint not found."}
+        return self._call_route(key, server_name, sub.get("body"))
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["migrate"]:
+        migrate_schema()
+    else:
+        sys.exit("usage: python api/index.py migrate")